@@ -3,103 +3,482 @@
 Simple HTTP server for LEOS First Orbit frontend
 """
 import argparse
+import datetime
+import email.utils
+import functools
+import io
 import os
+import signal
+import socket
 import sys
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+import threading
+import time
+from http import HTTPStatus
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
+from types import SimpleNamespace
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[logging.StreamHandler()]
-)
+# Logging handlers; once the server starts, request threads only enqueue
+# records and a background listener formats and writes them
+_stream_handler = logging.StreamHandler()
+_stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+_queue_handler = QueueHandler(queue.SimpleQueue())
+# The queue handler only merges args into the message; layout is applied on output
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))
 logger = logging.getLogger('LEOS-Server')
+_log_listener = None
+
+
+def _scan_dir(path):
+    """Return the entries of path keyed by name, or None if it cannot be listed"""
+    try:
+        with os.scandir(path) as it:
+            return {entry.name: entry for entry in it}
+    except OSError:
+        return None
+
+
+# Resolve frontend locations once from the script location; a single listing
+# of frontend/ answers which of its children exist
+_SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+_FRONTEND_DIR = os.path.join(_SCRIPT_DIR, 'frontend')
+_DIST_DIR = os.path.join(_FRONTEND_DIR, 'dist')
+_DATA_DIR = os.path.join(_FRONTEND_DIR, 'data')
+_ASSETS_DIR = os.path.join(_FRONTEND_DIR, 'assets')
+_FRONTEND_ENTRIES = _scan_dir(_FRONTEND_DIR)
+_SERVE_DIR = (_DIST_DIR if _FRONTEND_ENTRIES and 'dist' in _FRONTEND_ENTRIES
+              and _FRONTEND_ENTRIES['dist'].is_dir() else _FRONTEND_DIR)
+
+# Socket tuning for the listening socket; SO_BUSY_POLL is not exported by the
+# socket module, so fall back to the Linux constant
+_SO_BUSY_POLL = getattr(socket, 'SO_BUSY_POLL', 46 if sys.platform.startswith('linux') else None)
+_BUSY_POLL_USEC = 50
+_SOCKET_BUFFER_SIZE = 256 * 1024
+
+# Recently missing URL paths -> time of the miss, oldest first, so repeated
+# probes for optional files (favicons, source maps) skip the filesystem
+_NEGATIVE_CACHE = {}
+_NEGATIVE_CACHE_LOCK = threading.Lock()
+_NEGATIVE_CACHE_TTL = 2.0
+_NEGATIVE_CACHE_SIZE = 1024
+
+# Contents of small files keyed by filesystem path -> ((mtime_ns, size), bytes),
+# oldest first, so index.html and friends are served without open/read
+_FILE_CACHE = {}
+_FILE_CACHE_LOCK = threading.Lock()
+_FILE_CACHE_MAX_FILE = 1024 * 1024
+_FILE_CACHE_MAX_TOTAL = 32 * 1024 * 1024
+_file_cache_bytes = 0
 
 class LEOSHTTPRequestHandler(SimpleHTTPRequestHandler):
     """Custom request handler with proper MIME types"""
     
+    # Set TCP_NODELAY so small asset responses are not delayed by Nagle
+    disable_nagle_algorithm = True
+    
     def __init__(self, *args, **kwargs):
-        # Use script location to find frontend directory
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        frontend_dir = os.path.join(script_dir, 'frontend')
-        dist_dir = os.path.join(frontend_dir, 'dist')
-        if os.path.isdir(dist_dir):
-            serve_dir = dist_dir
-        else:
-            serve_dir = frontend_dir
-            logger.warning(f"Serving unbuilt frontend from {serve_dir}")
-        super().__init__(*args, directory=serve_dir, **kwargs)
+        super().__init__(*args, directory=_SERVE_DIR, **kwargs)
     
     def end_headers(self):
-        """Add cache-control headers to prevent caching during development"""
-        self.send_header('Cache-Control', 'no-store, no-cache, must-revalidate')
-        self.send_header('Pragma', 'no-cache')
-        self.send_header('Expires', '0')
+        """Make browsers revalidate every response so edits show up during development"""
+        self.send_header('Cache-Control', 'no-cache')
         super().end_headers()
     
+    def send_head(self):
+        """Serve files with an ETag so unchanged assets revalidate with a bodiless 304"""
+        # Answer recently missing paths with a 404 before touching the filesystem
+        missed_at = _NEGATIVE_CACHE.get(self.path)
+        if missed_at is not None and time.monotonic() - missed_at < _NEGATIVE_CACHE_TTL:
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return None
+        path = self.translate_path(self.path)
+        cached = _cached_file(path)
+        if cached is not None:
+            fs, body = cached
+            return self._send_file_head(path, fs, io.BytesIO(body), len(body))
+        # Open first and stat the descriptor, so a plain file costs one fstat;
+        # directories are only detected once the open has failed
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            f = None
+        if f is None:
+            if not os.path.isdir(path):
+                self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+                return None
+            if not path.endswith('/'):
+                # Let the stock handler redirect to the trailing-slash URL
+                return super().send_head()
+            index = os.path.join(path, 'index.html')
+            cached = _cached_file(index)
+            if cached is not None:
+                fs, body = cached
+                return self._send_file_head(index, fs, io.BytesIO(body), len(body))
+            try:
+                f = open(index, 'rb')
+            except OSError:
+                # index.htm and directory listings
+                return super().send_head()
+            path = index
+        try:
+            fs = os.fstat(f.fileno())
+            if fs.st_size <= _FILE_CACHE_MAX_FILE:
+                body = f.read()
+                # Only cache the body if the file did not change while it was read
+                after = os.fstat(f.fileno())
+                f.close()
+                if (after.st_mtime_ns, after.st_size) == (fs.st_mtime_ns, len(body)):
+                    _cache_file(path, fs, body)
+                f = io.BytesIO(body)
+                return self._send_file_head(path, fs, f, len(body))
+        except:
+            f.close()
+            raise
+        return self._send_file_head(path, fs, f)
+    
+    def _send_file_head(self, path, fs, f, size=None):
+        """Send the 200 or 304 headers for an open file and return it for copying"""
+        if size is None:
+            size = fs.st_size
+        try:
+            etag = '"%x-%x"' % (fs.st_mtime_ns, fs.st_size)
+            if self._not_modified(etag, fs):
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                f.close()
+                return None
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-type", self.guess_type(path))
+            self.send_header("Content-Length", str(size))
+            self.send_header("Last-Modified", self.date_time_string(fs.st_mtime))
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return f
+        except:
+            f.close()
+            raise
+    
+    def _not_modified(self, etag, fs):
+        """Check If-None-Match against etag, or else If-Modified-Since against the mtime"""
+        header = self.headers.get('If-None-Match')
+        if header:
+            for candidate in header.split(','):
+                candidate = candidate.strip()
+                if candidate == '*' or candidate.removeprefix('W/') == etag:
+                    return True
+            return False
+        # Same date revalidation as the stock send_head
+        header = self.headers.get('If-Modified-Since')
+        if not header:
+            return False
+        try:
+            ims = email.utils.parsedate_to_datetime(header)
+        except (TypeError, IndexError, OverflowError, ValueError):
+            return False
+        if ims.tzinfo is None:
+            ims = ims.replace(tzinfo=datetime.timezone.utc)
+        if ims.tzinfo is not datetime.timezone.utc:
+            return False
+        last_modif = datetime.datetime.fromtimestamp(fs.st_mtime, datetime.timezone.utc)
+        return last_modif.replace(microsecond=0) <= ims
+    
+    def send_error(self, code, message=None, explain=None):
+        if code == HTTPStatus.NOT_FOUND:
+            _remember_missing(self.path)
+        super().send_error(code, message, explain)
+    
+    def copyfile(self, source, outputfile):
+        """Send regular files with sendfile(2) instead of copying through user space"""
+        try:
+            source.fileno()
+        except (AttributeError, OSError):
+            # In-memory bodies such as directory listings
+            return super().copyfile(source, outputfile)
+        # wfile is unbuffered, so the headers are already on the socket
+        self.connection.sendfile(source)
+    
     def log_message(self, format, *args):
         """Override to use our logger instead of stderr"""
-        logger.info("%s - %s", self.address_string(), format % args)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("%s - %s", self.address_string(), format % args)
     
     def translate_path(self, path):
-        # Serve raw data files from the source frontend/data directory
-        if path.startswith('/data/'):
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            data_dir = os.path.join(script_dir, 'frontend', 'data')
-            rel_path = path[len('/data/'):]
-            return os.path.join(data_dir, rel_path)
-        # Support URLs with /dist/ prefix by stripping it
-        if path.startswith('/dist/'):
-            # remove '/dist' to map to actual files in serve_dir
-            path = path[len('/dist'):]
-        # Serve raw assets not in dist from the source frontend/assets directory
-        if path.startswith('/assets/'):
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            assets_src = os.path.join(script_dir, 'frontend', 'assets')
-            rel_path = path[len('/assets/'):]
-            return os.path.join(assets_src, rel_path)
-        return super().translate_path(path)
-
-
-def run_server(host='0.0.0.0', port=8080):
+        return _translate(path)
+
+
+def _remember_missing(path):
+    """Record a 404 for path, keeping the original time while the entry is fresh"""
+    now = time.monotonic()
+    with _NEGATIVE_CACHE_LOCK:
+        missed_at = _NEGATIVE_CACHE.get(path)
+        if missed_at is not None and now - missed_at < _NEGATIVE_CACHE_TTL:
+            return
+        _NEGATIVE_CACHE.pop(path, None)
+        if len(_NEGATIVE_CACHE) >= _NEGATIVE_CACHE_SIZE:
+            del _NEGATIVE_CACHE[next(iter(_NEGATIVE_CACHE))]
+        _NEGATIVE_CACHE[path] = now
+
+
+def _clear_negative_cache(signum=None, frame=None):
+    """Forget all recorded 404s (also bound to SIGUSR1)"""
+    with _NEGATIVE_CACHE_LOCK:
+        _NEGATIVE_CACHE.clear()
+
+
+def _cached_file(path):
+    """Return (stat, bytes) for path if its cached contents are still current"""
+    entry = _FILE_CACHE.get(path)
+    if entry is None:
+        return None
+    try:
+        fs = os.stat(path)
+    except OSError:
+        return None
+    if (fs.st_mtime_ns, fs.st_size) != entry[0]:
+        return None
+    return fs, entry[1]
+
+
+def _cache_file(path, fs, body):
+    """Store the contents of a small file, evicting the oldest entries to stay in budget"""
+    global _file_cache_bytes
+    with _FILE_CACHE_LOCK:
+        stale = _FILE_CACHE.pop(path, None)
+        if stale is not None:
+            _file_cache_bytes -= len(stale[1])
+        while _FILE_CACHE and _file_cache_bytes + len(body) > _FILE_CACHE_MAX_TOTAL:
+            _file_cache_bytes -= len(_FILE_CACHE.pop(next(iter(_FILE_CACHE)))[1])
+        _FILE_CACHE[path] = ((fs.st_mtime_ns, fs.st_size), body)
+        _file_cache_bytes += len(body)
+
+
+# SimpleHTTPRequestHandler.translate_path only reads .directory, so it can
+# resolve paths against the serve directory without a live handler
+_SERVE_ROOT = SimpleNamespace(directory=_SERVE_DIR)
+
+
+@functools.lru_cache(maxsize=4096)
+def _translate(path):
+    """Map a URL path to a filesystem path; the mapping is fixed for the server's lifetime"""
+    # The source directories are absolute without a trailing slash, so plain
+    # concatenation is enough; anything containing '..' goes through the
+    # stock translation, which cannot escape the serve directory
+    # Serve raw data files from the source frontend/data directory
+    if path.startswith('/data/'):
+        rel_path = path[len('/data/'):]
+        if '..' not in rel_path:
+            return f'{_DATA_DIR}/{rel_path}'
+    # Support URLs with /dist/ prefix by stripping it
+    if path.startswith('/dist/'):
+        # remove '/dist' to map to actual files in serve_dir
+        path = path[len('/dist'):]
+    # Serve raw assets not in dist from the source frontend/assets directory
+    if path.startswith('/assets/'):
+        rel_path = path[len('/assets/'):]
+        if '..' not in rel_path:
+            return f'{_ASSETS_DIR}/{rel_path}'
+    return SimpleHTTPRequestHandler.translate_path(_SERVE_ROOT, path)
+
+
+class LEOSHTTPServer(ThreadingHTTPServer):
+    """Threaded HTTP server with tuned socket options"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def server_bind(self):
+        # Accepted sockets inherit these from the listening socket
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, _SOCKET_BUFFER_SIZE)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, _SOCKET_BUFFER_SIZE)
+        if _SO_BUSY_POLL is not None:
+            try:
+                self.socket.setsockopt(socket.SOL_SOCKET, _SO_BUSY_POLL, _BUSY_POLL_USEC)
+            except OSError as e:
+                # Raising it above net.core.busy_read needs CAP_NET_ADMIN
+                logger.debug("SO_BUSY_POLL not enabled: %s", e)
+        super().server_bind()
+
+
+def _start_log_listener():
+    """Route logging through the queue and write it from a background thread"""
+    global _log_listener
+    # Wired up here rather than at import, so importing the module leaves logging alone
+    logging.basicConfig(level=logging.INFO, handlers=[_queue_handler])
+    _log_listener = QueueListener(_queue_handler.queue, _stream_handler)
+    _log_listener.start()
+
+
+def run_server(host='0.0.0.0', port=8080, workers=1):
     """Start the HTTP server"""
-    server_address = (host, port)
-    
-    # Use script location to find frontend directory
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    frontend_dir = os.path.join(script_dir, 'frontend')
-    if not os.path.isdir(frontend_dir):
-        logger.error(f"Frontend directory not found: {frontend_dir}")
-        sys.exit(1)
-    # Choose serve directory based on build output
-    dist_dir = os.path.join(frontend_dir, 'dist')
-    if os.path.isdir(dist_dir):
-        serve_dir = dist_dir
+    try:
+        _serve(host, port, workers)
+    finally:
+        # Flush queued records before the process exits
+        if _log_listener is not None:
+            _log_listener.stop()
+
+
+def run_server_async(host='0.0.0.0', port=8080):
+    """Start the server on aiohttp's event loop instead of a thread per request"""
+    _start_log_listener()
+    try:
+        _serve_async(host, port)
+    finally:
+        _log_listener.stop()
+
+
+def _check_frontend():
+    """Return the directory to serve (None if there is no frontend) and the log calls describing it
+
+    The messages are returned rather than logged so _serve can check the
+    frontend before binding and forking, and log them once its listener runs.
+    """
+    if _FRONTEND_ENTRIES is None:
+        return None, [(logging.ERROR, "Frontend directory not found: %s", _FRONTEND_DIR)]
+    messages = []
+    serve_dir = _SERVE_DIR
+    if serve_dir != _DIST_DIR:
+        messages.append((logging.WARNING, "Build output not found, serving unbuilt frontend from %s", serve_dir))
+        serve_entries = _FRONTEND_ENTRIES
     else:
-        serve_dir = frontend_dir
-        logger.warning(f"Build output not found, serving unbuilt frontend from {serve_dir}")
+        serve_entries = _scan_dir(_DIST_DIR) or {}
     # Check for index.html
-    index_file = os.path.join(serve_dir, 'index.html')
-    if not os.path.exists(index_file):
-        logger.warning(f"index.html not found in {serve_dir}. Make sure build is correct.")
+    if 'index.html' not in serve_entries:
+        messages.append((logging.WARNING, "index.html not found in %s. Make sure build is correct.", serve_dir))
+    return serve_dir, messages
+
+
+def _serve(host, port, workers):
+    server_address = (host, port)
+    # Validate before binding the port or forking workers
+    serve_dir, messages = _check_frontend()
+    if serve_dir is None:
+        _start_log_listener()
+        for message in messages:
+            logger.log(*message)
+        sys.exit(1)
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, _clear_negative_cache)
+    httpd = LEOSHTTPServer(server_address, LEOSHTTPRequestHandler)
     
-    httpd = HTTPServer(server_address, LEOSHTTPRequestHandler)
-    logger.info(f"Starting server at http://{host}:{port}/ serving from {serve_dir}")
+    # Forked workers inherit the listening socket and share its accept queue.
+    # Fork while the process is still single-threaded and nothing has been
+    # logged, then start a log listener in every process
+    children = []
+    if workers > 1 and hasattr(os, 'fork'):
+        # Turn SIGTERM into a normal shutdown so workers are reaped and logs flushed
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        for _ in range(workers - 1):
+            pid = os.fork()
+            if pid == 0:
+                children = None
+                break
+            children.append(pid)
+    _start_log_listener()
     
     try:
+        if children is not None:
+            for message in messages:
+                logger.log(*message)
+            logger.info("Starting server at http://%s:%s/ serving from %s", host, port, serve_dir)
+            if workers > 1 and not hasattr(os, 'fork'):
+                logger.warning("--workers is not supported on this platform, using a single process")
+            elif workers > 1:
+                logger.info("Started %d worker processes", workers)
         httpd.serve_forever()
     except KeyboardInterrupt:
-        logger.info("Server stopped by user")
+        if children is not None:
+            logger.info("Server stopped by user")
     finally:
         httpd.server_close()
-        logger.info("Server closed")
+        if children is not None:
+            for pid in children:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+                os.waitpid(pid, 0)
+            logger.info("Server closed")
+
+
+def _serve_async(host, port):
+    try:
+        from aiohttp import web
+    except ImportError:
+        logger.error("--async requires aiohttp (pip install aiohttp)")
+        sys.exit(1)
+    serve_dir, messages = _check_frontend()
+    for message in messages:
+        logger.log(*message)
+    if serve_dir is None:
+        sys.exit(1)
+    
+    async def index(request):
+        return web.FileResponse(os.path.join(serve_dir, 'index.html'))
+    
+    async def add_cache_headers(request, response):
+        # Same revalidate-every-time policy as the threaded server
+        response.headers['Cache-Control'] = 'no-cache'
+    
+    @web.middleware
+    async def directory_index(request, handler):
+        # Serve a directory's index.html like the threaded server; add_static
+        # only lists directories
+        if request.path.endswith('/'):
+            index_path = os.path.join(_translate(request.rel_url.raw_path), 'index.html')
+            if os.path.isfile(index_path):
+                return web.FileResponse(index_path)
+            return await handler(request)
+        response = await handler(request)
+        # Files come back as FileResponse, so a plain response is a listing;
+        # redirect to the trailing-slash URL so relative links resolve
+        if type(response) is web.Response:
+            url = request.rel_url
+            raise web.HTTPMovedPermanently(url.with_path(url.path + '/').with_query(url.query))
+        return response
+    
+    async def not_found(request):
+        raise web.HTTPNotFound()
+    
+    # aiohttp's static handler already uses sendfile, ETags and TCP_NODELAY
+    app = web.Application(middlewares=[directory_index])
+    app.on_response_prepare.append(add_cache_headers)
+    app.router.add_get('/', index)
+    # add_static rejects missing directories; answer their URLs with a 404 so
+    # they do not fall through to the catch-all route below
+    for prefix, directory in (('/data/', _DATA_DIR), ('/assets/', _ASSETS_DIR)):
+        if os.path.isdir(directory):
+            app.router.add_static(prefix, directory, show_index=True)
+        else:
+            logger.warning("%s not found, not serving %s", directory, prefix)
+            app.router.add_route('*', prefix + '{tail:.*}', not_found)
+    app.router.add_static('/dist/', serve_dir, show_index=True)
+    app.router.add_static('/', serve_dir, show_index=True)
+    
+    logger.info("Starting async server at http://%s:%s/ serving from %s", host, port, serve_dir)
+    web.run_app(app, host=host, port=port, access_log=logger, print=None)
+    logger.info("Server closed")
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="LEOS First Orbit HTTP Server")
     parser.add_argument('--host', type=str, default='0.0.0.0', help='Host to bind to (default: 0.0.0.0)')
     parser.add_argument('--port', type=int, default=8080, help='Port to bind to (default: 8080)')
+    parser.add_argument('--workers', type=int, default=1, help='Number of server processes sharing the port (default: 1)')
+    parser.add_argument('--quiet', action='store_true', help='Only log warnings and errors, not every request')
+    parser.add_argument('--async', dest='use_async', action='store_true', help='Serve with aiohttp on a single event loop (requires aiohttp)')
     args = parser.parse_args()
+    if args.use_async and args.workers > 1:
+        parser.error("--workers cannot be combined with --async")
     
-    run_server(host=args.host, port=args.port)
+    if args.quiet:
+        logger.setLevel(logging.WARNING)
+    
+    if args.use_async:
+        run_server_async(host=args.host, port=args.port)
+    else:
+        run_server(host=args.host, port=args.port, workers=args.workers)